@@ -3,25 +3,40 @@ Silent Pro Dashboard - FastAPI Backend
 """
 import os
 import asyncio
+import functools
 import logging
+import random
+import sqlite3
+import tempfile
+import threading
 import time
 from datetime import datetime, timezone, timedelta
-from typing import Optional
-from fastapi import FastAPI, HTTPException
+from typing import Literal, Optional
+from zoneinfo import ZoneInfo
+import anyio
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
 from sp_api.api import Orders
-from sp_api.base import Marketplaces
+from sp_api.base import (
+    Marketplaces,
+    SellingApiBadRequestException,
+    SellingApiNotFoundException,
+    SellingApiRequestThrottledException,
+)
 from dotenv import load_dotenv
-from collections import defaultdict
+
+__all__ = ["app"]
 
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Silent Pro Dashboard")
+app = FastAPI(title="Silent Pro Dashboard", default_response_class=ORJSONResponse)
 
 # Configuration
 CONFIG = {
@@ -33,14 +48,129 @@ CONFIG = {
     "SP_API_ROLE_ARN": os.getenv("SP_API_ROLE_ARN"),
     "MARKETPLACE_ID": os.getenv("MARKETPLACE_ID", "ATVPDKIKX0DER"),
     "DAY_START_HOUR_UTC": 7,  # 4am ART = 7am UTC
+    # Defaults to the temp dir, the one writable place on serverless hosts like Vercel
+    "ORDERS_DB_PATH": os.getenv(
+        "ORDERS_DB_PATH", os.path.join(tempfile.gettempdir(), "silent-pro-dashboard-orders.db")
+    ),
 }
 
+# Argentina timezone; business days start at 4am ART
+ART = ZoneInfo("America/Argentina/Buenos_Aires")
+BUSINESS_DAY_START_ART = timedelta(hours=4)
+
 PRODUCTS = {
     "VM-7EA4-DVAO": "Black Mamba Premium",
     "5Y-T9K7-1HM1": "Black Mamba Lite",
     "J9-H173-J5AF": "Old School Mini",
 }
 
+# Concurrent getOrderItems calls in flight; their pace is set by the rate limiter below
+ORDER_ITEMS_CONCURRENCY = 5
+_items_limiter = anyio.CapacityLimiter(ORDER_ITEMS_CONCURRENCY)
+
+# Uncached /api/orders requests allowed to run at once; more get a 429
+MAX_CONCURRENT_FETCHES = 4
+_fetch_limiter = anyio.CapacityLimiter(MAX_CONCURRENT_FETCHES)
+
+
+class RateLimiter:
+    """Token bucket that only sleeps once the burst allowance is used up"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take a token, sleeping for it unless that would exceed timeout (then False)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return False
+            # Reserve the token now (going negative) so waiters queue up without the lock
+            self._tokens -= 1
+        time.sleep(wait)
+        return True
+
+    def drain(self):
+        """Empty the bucket after a throttled call so the next acquire waits for a fresh token"""
+        with self._lock:
+            self._tokens = 0.0
+            self._last = time.monotonic()
+
+    def update_rate(self, rate_limit: Optional[str]):
+        """Adopt the rate Amazon reports in the x-amzn-RateLimit-Limit header"""
+        try:
+            rate = float(rate_limit)
+        except (TypeError, ValueError):
+            return
+        if rate > 0:
+            with self._lock:
+                self.rate = rate
+
+
+_orders_client: Optional[Orders] = None
+_orders_client_lock = threading.Lock()
+
+# Serialized /api/orders responses, so polling clients don't refetch from SP-API
+_response_cache = TTLCache(maxsize=256, ttl=60)
+
+# Local order store, synced incrementally from SP-API
+ORDERS_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    amazon_order_id TEXT PRIMARY KEY,
+    purchase_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    art_date TEXT NOT NULL,
+    number_of_items INTEGER NOT NULL DEFAULT 0,
+    order_total REAL NOT NULL DEFAULT 0,
+    items_json TEXT,
+    last_updated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_purchase_date ON orders (purchase_date);
+CREATE TABLE IF NOT EXISTS order_items (
+    amazon_order_id TEXT NOT NULL REFERENCES orders (amazon_order_id),
+    sku TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    price REAL NOT NULL,
+    revenue REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (amazon_order_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_sku ON order_items (sku);
+CREATE TABLE IF NOT EXISTS sync_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    synced_from TEXT NOT NULL,  -- Every order created since then is stored...
+    synced_at TEXT NOT NULL,    -- ...with its updates up to this time
+    backfill_from TEXT,         -- Backfill in progress: CreatedAfter of its query
+    backfill_token TEXT,        -- and the NextToken of its next page
+    delta_at TEXT,              -- Delta in progress: synced_at once it finishes
+    delta_token TEXT            -- and the NextToken of its next page
+);
+"""
+SYNC_STATE_COLUMNS = ("synced_from", "synced_at", "backfill_from", "backfill_token", "delta_at", "delta_token")
+SYNC_INTERVAL = timedelta(seconds=60)
+SYNC_OVERLAP = timedelta(minutes=5)  # Re-read recent updates SP-API may not have exposed yet
+# Seconds of getOrders paging per request; a longer sync resumes on the next request
+SYNC_TIME_BUDGET = 10
+_db: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+# getOrders default usage plan: 0.0167 requests/second, burst of 20
+_orders_rate_limiter = RateLimiter(rate=0.0167, burst=20)
+
+# getOrderItems default usage plan: 0.5 requests/second, burst of 30
+_order_items_rate_limiter = RateLimiter(rate=0.5, burst=30)
+# Throttled getOrderItems retries (about 2s apart) before giving up on an order
+MAX_THROTTLED_RETRIES = 5
+# Seconds of getOrderItems calls per request; orders left without items are fetched next time
+ITEMS_TIME_BUDGET = 10
+
 
 def get_credentials():
     return {
@@ -53,6 +183,32 @@ def get_credentials():
     }
 
 
+def get_orders_client() -> Orders:
+    """Get the shared Orders client, creating it on first use"""
+    global _orders_client
+    if _orders_client is None:
+        with _orders_client_lock:
+            if _orders_client is None:
+                _orders_client = Orders(credentials=get_credentials(), marketplace=Marketplaces.US)
+    return _orders_client
+
+
+def get_db() -> sqlite3.Connection:
+    """Get the shared SQLite connection, creating the schema on first use"""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                db = sqlite3.connect(CONFIG["ORDERS_DB_PATH"], check_same_thread=False)
+                db.executescript(ORDERS_DB_SCHEMA)
+                _db = db
+    return _db
+
+
+def to_sp_api_timestamp(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
 def get_business_day_start_utc(days_back: int = 0) -> datetime:
     """Get business day start in UTC. Business day: 4am ART = 7am UTC"""
     now = datetime.now(timezone.utc)
@@ -84,34 +240,45 @@ def date_string_to_utc(date_str: str, is_end: bool = False) -> datetime:
 
 def get_argentina_date(utc_dt: datetime) -> str:
     """Convert UTC to Argentina date string"""
-    art_time = utc_dt - timedelta(hours=3)
-    return art_time.strftime("%Y-%m-%d")
+    return utc_dt.astimezone(ART).date().isoformat()
 
 
 def get_current_argentina_date() -> str:
     """Get current date in Argentina (considering 4am boundary)"""
-    now = datetime.now(timezone.utc)
-    art_time = now - timedelta(hours=3)
+    # Shifting back to the 4am start keeps times before 4am ART on "yesterday"
+    business_time = datetime.now(ART) - BUSINESS_DAY_START_ART
+    return business_time.date().isoformat()
+
+
+@functools.lru_cache(maxsize=4096)
+def _art_date_key(purchase_date: str) -> str:
+    """Convert an ISO PurchaseDate to its Argentina business day (4am boundary)"""
+    order_date_utc = datetime.fromisoformat(purchase_date.replace("Z", "+00:00"))
+    business_time = order_date_utc.astimezone(ART) - BUSINESS_DAY_START_ART
+    return business_time.date().isoformat()
+
+
+# Stand-in for a missing ItemPrice/OrderTotal money object
+_EMPTY = {}
 
-    # If before 4am ART, still "yesterday"
-    if art_time.hour < 4:
-        art_time -= timedelta(days=1)
 
-    return art_time.strftime("%Y-%m-%d")
+@functools.lru_cache(maxsize=1024)
+def _parse_amount(amount: str) -> float:
+    """Parse a money Amount string; Amazon repeats the same few prices constantly"""
+    return float(amount)
 
 
 class OrdersRequest(BaseModel):
     days_back: int = 0
-    product_sku: str = "ALL"
+    product_sku: Literal[("ALL", *PRODUCTS)] = "ALL"
+    # False skips getOrderItems for "ALL": no byProduct, and byDate comes from order-level
+    # fields, so revenue includes shipping and tax, Pending orders count no revenue (no
+    # OrderTotal yet) and Canceled orders count no units
+    include_items: bool = True
     start_date: Optional[str] = None
     end_date: Optional[str] = None
 
 
-@app.get("/")
-async def root():
-    return FileResponse("static/index.html")
-
-
 @app.get("/api/products")
 async def get_products():
     return [
@@ -122,10 +289,346 @@ async def get_products():
     ]
 
 
-def _fetch_orders_sync(request: OrdersRequest):
-    """Run SP-API calls in a thread to avoid blocking the async event loop."""
-    credentials = get_credentials()
-    orders_api = Orders(credentials=credentials, marketplace=Marketplaces.US)
+def _fetch_order_items(orders_api, order_id: str, deadline: Optional[float] = None) -> Optional[list]:
+    """Get order items with jittered exponential backoff retry, None if it keeps failing.
+
+    Throttled calls wait for the next rate-limiter token instead of backing off, up to
+    MAX_THROTTLED_RETRIES times. Raises TimeoutError if no token is free before deadline.
+    """
+    attempt = 0
+    throttled = 0
+    while True:
+        timeout = None if deadline is None else deadline - time.monotonic()
+        if not _order_items_rate_limiter.acquire(timeout=timeout):
+            raise TimeoutError(f"No getOrderItems quota left for {order_id} in this request")
+        try:
+            items_response = orders_api.get_order_items(order_id)
+            _order_items_rate_limiter.update_rate(items_response.rate_limit)
+            return items_response.payload.get("OrderItems", [])
+        except SellingApiRequestThrottledException as e:
+            # Quota is shared with other callers of this selling account
+            if throttled >= MAX_THROTTLED_RETRIES:
+                logger.warning("Failed to fetch items for %s: %s", order_id, e)
+                return None
+            _order_items_rate_limiter.drain()
+            throttled += 1
+        except (SellingApiBadRequestException, SellingApiNotFoundException) as e:
+            # Retrying won't fix an invalid or unknown order
+            logger.warning("Failed to fetch items for %s: %s", order_id, e)
+            return None
+        except Exception as e:
+            if attempt >= 4:
+                logger.warning("Failed to fetch items for %s: %s", order_id, e)
+                return None
+            backoff = min(4, (2 ** attempt) * 0.5)  # 0.5, 1, 2, 4 seconds
+            time.sleep(backoff + random.uniform(0, 0.25))
+            attempt += 1
+
+
+def _upsert_orders(orders: list, **sync_state):
+    """Store orders, dropping saved items of any order that changed since.
+
+    Any sync_state columns given are updated in the same transaction.
+    """
+    rows = [
+        (
+            o["AmazonOrderId"],
+            o["PurchaseDate"],
+            o["OrderStatus"],
+            _art_date_key(o["PurchaseDate"]),
+            int(o.get("NumberOfItemsShipped", 0)) + int(o.get("NumberOfItemsUnshipped", 0)),
+            _parse_amount((o.get("OrderTotal") or _EMPTY).get("Amount") or "0"),
+            o.get("LastUpdateDate") or o["PurchaseDate"],
+        )
+        for o in orders
+    ]
+    db = get_db()
+    with _db_lock, db:
+        db.executemany(
+            """
+            INSERT INTO orders (
+                amazon_order_id, purchase_date, status, art_date, number_of_items, order_total, last_updated
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (amazon_order_id) DO UPDATE SET
+                status = excluded.status,
+                number_of_items = excluded.number_of_items,
+                order_total = excluded.order_total,
+                items_json = CASE WHEN orders.last_updated = excluded.last_updated
+                                  THEN orders.items_json END,
+                last_updated = excluded.last_updated
+            """,
+            rows,
+        )
+        db.executemany(
+            """
+            DELETE FROM order_items WHERE amazon_order_id = (
+                SELECT amazon_order_id FROM orders WHERE amazon_order_id = ? AND items_json IS NULL
+            )
+            """,
+            [(row[0],) for row in rows],
+        )
+        if sync_state:
+            _write_sync_state(db, sync_state)
+
+
+def _write_sync_state(db: sqlite3.Connection, sync_state: dict):
+    assignments = ", ".join(f"{column} = ?" for column in sync_state)
+    db.execute(f"UPDATE sync_state SET {assignments} WHERE id = 1", list(sync_state.values()))
+
+
+def _save_sync_state(**sync_state):
+    db = get_db()
+    with _db_lock, db:
+        _write_sync_state(db, sync_state)
+
+
+def _load_sync_state() -> dict:
+    """Read the sync state, starting an empty one just behind now if there is none"""
+    db = get_db()
+    with _db_lock, db:
+        row = db.execute(f"SELECT {', '.join(SYNC_STATE_COLUMNS)} FROM sync_state").fetchone()
+        if row is None:
+            start = to_sp_api_timestamp(datetime.now(timezone.utc) - SYNC_OVERLAP)
+            db.execute("INSERT INTO sync_state (id, synced_from, synced_at) VALUES (1, ?, ?)", (start, start))
+            row = (start, start, None, None, None, None)
+    return dict(zip(SYNC_STATE_COLUMNS, row))
+
+
+def _sync_pages(orders_api, filters: dict, cursor: str, token: Optional[str], deadline: float) -> bool:
+    """Store a getOrders query page by page until its last page, or stop at the deadline.
+
+    Each page is saved together with the NextToken of the following one (in the sync_state
+    column named by cursor), so a query cut short resumes where it stopped. Returns True once
+    the last page is stored.
+    """
+    while time.monotonic() < deadline:
+        if not _orders_rate_limiter.acquire(timeout=deadline - time.monotonic()):
+            return False
+        try:
+            if token:
+                response = orders_api.get_orders(NextToken=token)
+            else:
+                response = orders_api.get_orders(MaxResultsPerPage=100, **filters)
+        except SellingApiRequestThrottledException:
+            # Quota is shared with other callers of this selling account; the next
+            # token is a full interval away, which usually ends this round
+            _orders_rate_limiter.drain()
+            continue
+        except SellingApiBadRequestException as e:
+            if not token:
+                raise
+            # Page tokens expire; start the query over from its first page next time
+            logger.warning("Restarting order sync after a rejected page token: %s", e)
+            _save_sync_state(**{cursor: None})
+            return False
+        _orders_rate_limiter.update_rate(response.rate_limit)
+
+        token = response.payload.get("NextToken")
+        _upsert_orders(response.payload.get("Orders", []), **{cursor: token})
+        if not token:
+            return True
+    return False
+
+
+def _sync_orders(orders_api, created_after: datetime) -> bool:
+    """Bring the local store up to date for everything created since created_after.
+
+    A backfill pulls orders created before the stored range by CreatedAfter/CreatedBefore;
+    a delta pulls orders updated since the last sync by LastUpdatedAfter. Both page within
+    SYNC_TIME_BUDGET and resume on the next call. Returns whether the store now fully covers
+    the window.
+    """
+    if not _sync_lock.acquire(timeout=SYNC_TIME_BUDGET):
+        return False  # Another request is syncing; serve what's stored
+    try:
+        deadline = time.monotonic() + SYNC_TIME_BUDGET
+        state = _load_sync_state()
+        now = datetime.now(timezone.utc)
+        wanted_from = to_sp_api_timestamp(created_after)
+        complete = True
+
+        if wanted_from < state["synced_from"]:
+            if state["backfill_from"] is None or wanted_from < state["backfill_from"]:
+                # Reach back to the requested window, restarting any shallower backfill
+                state["backfill_from"], state["backfill_token"] = wanted_from, None
+                _save_sync_state(backfill_from=wanted_from, backfill_token=None)
+            filters = {"CreatedAfter": state["backfill_from"], "CreatedBefore": state["synced_from"]}
+            if _sync_pages(orders_api, filters, "backfill_token", state["backfill_token"], deadline):
+                _save_sync_state(synced_from=state["backfill_from"], backfill_from=None, backfill_token=None)
+            else:
+                complete = False
+
+        synced_at = datetime.fromisoformat(state["synced_at"].replace("Z", "+00:00"))
+        if state["delta_at"] is not None or now - synced_at >= SYNC_INTERVAL:
+            if state["delta_at"] is None:
+                state["delta_at"] = to_sp_api_timestamp(now)
+                _save_sync_state(delta_at=state["delta_at"], delta_token=None)
+            filters = {"LastUpdatedAfter": to_sp_api_timestamp(synced_at - SYNC_OVERLAP)}
+            if _sync_pages(orders_api, filters, "delta_token", state["delta_token"], deadline):
+                _save_sync_state(synced_at=state["delta_at"], delta_at=None, delta_token=None)
+            else:
+                complete = False
+
+        return complete
+    finally:
+        _sync_lock.release()
+
+
+def _window_clause(created_after: datetime, created_before: Optional[datetime]) -> tuple:
+    """SQL condition selecting orders (aliased o) purchased within the window"""
+    clause = "o.purchase_date >= ?"
+    params = [to_sp_api_timestamp(created_after)]
+    if created_before:
+        clause += " AND o.purchase_date < ?"
+        params.append(to_sp_api_timestamp(created_before))
+    return clause, params
+
+
+def _orders_missing_items(created_after: datetime, created_before: Optional[datetime]) -> list:
+    """Orders in the window whose items haven't been fetched yet"""
+    clause, params = _window_clause(created_after, created_before)
+    db = get_db()
+    with _db_lock:
+        rows = db.execute(
+            f"SELECT amazon_order_id, status, last_updated FROM orders o WHERE {clause} AND items_json IS NULL",
+            params,
+        ).fetchall()
+    return [
+        {"AmazonOrderId": order_id, "OrderStatus": status, "LastUpdateDate": last_updated}
+        for order_id, status, last_updated in rows
+    ]
+
+
+def _hydrate_order_items(orders_api, order: dict, deadline: Optional[float] = None) -> bool:
+    """Fetch an order's items and save them alongside the order.
+
+    Returns False if the deadline passed first, leaving the order for a later request.
+    """
+    try:
+        items = _fetch_order_items(orders_api, order["AmazonOrderId"], deadline)
+    except TimeoutError:
+        return False
+    if items is None:
+        return True
+
+    order_id = order["AmazonOrderId"]
+    rows = []
+    for item in items:
+        qty = item.get("QuantityOrdered", 1)
+        price = _parse_amount((item.get("ItemPrice") or _EMPTY).get("Amount") or "0")
+        rows.append((order_id, item.get("SellerSKU", ""), qty, price, price * qty))
+
+    db = get_db()
+    with _db_lock, db:
+        # A sync may have updated the order while its items were being fetched;
+        # those items are stale then, and the order stays missing for a refetch
+        updated = db.execute(
+            "UPDATE orders SET items_json = ? WHERE amazon_order_id = ? AND last_updated = ?",
+            (orjson.dumps(items).decode(), order_id, order["LastUpdateDate"]),
+        ).rowcount
+        if not updated:
+            return True
+        db.execute("DELETE FROM order_items WHERE amazon_order_id = ?", (order_id,))
+        db.executemany(
+            "INSERT INTO order_items (amazon_order_id, sku, quantity, price, revenue) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    return True
+
+
+def _status_summary(statuses: dict) -> dict:
+    return {
+        "shipped": statuses.get("Shipped", 0),
+        "pending": statuses.get("Pending", 0),
+        "canceled": statuses.get("Canceled", 0),
+    }
+
+
+def _aggregate_orders(created_after: datetime, created_before: Optional[datetime], product_sku: str):
+    """Build totalOrders/byProduct/byDate/summary with SQL aggregates over the window"""
+    clause, params = _window_clause(created_after, created_before)
+    item_clause, item_params = clause, params
+    if product_sku != "ALL":
+        item_clause += " AND i.sku = ?"
+        item_params = params + [product_sku]
+    items_join = "order_items i JOIN orders o USING (amazon_order_id)"
+
+    db = get_db()
+    with _db_lock:
+        statuses = dict(db.execute(
+            f"SELECT o.status, COUNT(*) FROM orders o WHERE {clause} GROUP BY o.status",
+            params,
+        ).fetchall())
+        lines = db.execute(
+            f"""
+            SELECT i.sku, o.amazon_order_id, o.status, i.quantity, i.price, o.art_date
+            FROM {items_join} WHERE {item_clause} ORDER BY o.purchase_date, i.rowid
+            """,
+            item_params,
+        ).fetchall()
+        product_totals = db.execute(
+            f"SELECT i.sku, SUM(i.quantity), SUM(i.revenue) FROM {items_join} "
+            f"WHERE {item_clause} GROUP BY i.sku",
+            item_params,
+        ).fetchall()
+        date_totals = db.execute(
+            f"SELECT o.art_date, SUM(i.quantity), SUM(i.revenue) FROM {items_join} "
+            f"WHERE {item_clause} GROUP BY o.art_date",
+            item_params,
+        ).fetchall()
+
+    by_product = {}
+    for sku, order_id, status, qty, price, date_key in lines:
+        product_name = PRODUCTS.get(sku, sku)
+        product = by_product.get(product_name)
+        if product is None:
+            product = by_product[product_name] = {"orders": [], "totalUnits": 0, "totalRevenue": 0}
+        product["orders"].append({
+            "orderId": order_id,
+            "status": status,
+            "quantity": qty,
+            "price": price,
+            "date": date_key,
+        })
+    for sku, units, revenue in product_totals:
+        product = by_product[PRODUCTS.get(sku, sku)]
+        product["totalUnits"] = units
+        product["totalRevenue"] = revenue
+
+    by_date = {date_key: {"units": units, "revenue": revenue} for date_key, units, revenue in date_totals}
+
+    return sum(statuses.values()), by_product, by_date, _status_summary(statuses)
+
+
+def _aggregate_order_totals(created_after: datetime, created_before: Optional[datetime]):
+    """Like _aggregate_orders but from order-level counts and totals, without items.
+
+    byProduct is left empty since the per-SKU split needs getOrderItems. byDate sums
+    NumberOfItemsShipped + NumberOfItemsUnshipped and OrderTotal, so it is not on the same
+    basis as item prices: see OrdersRequest.include_items.
+    """
+    clause, params = _window_clause(created_after, created_before)
+    db = get_db()
+    with _db_lock:
+        statuses = dict(db.execute(
+            f"SELECT o.status, COUNT(*) FROM orders o WHERE {clause} GROUP BY o.status",
+            params,
+        ).fetchall())
+        date_totals = db.execute(
+            f"SELECT o.art_date, SUM(o.number_of_items), SUM(o.order_total) FROM orders o "
+            f"WHERE {clause} GROUP BY o.art_date",
+            params,
+        ).fetchall()
+
+    by_date = {date_key: {"units": units, "revenue": revenue} for date_key, units, revenue in date_totals}
+
+    return sum(statuses.values()), {}, by_date, _status_summary(statuses)
+
+
+async def _fetch_orders(request: OrdersRequest):
+    """Run blocking SP-API calls in threads, fanning out getOrderItems concurrently."""
+    orders_api = get_orders_client()
 
     is_custom_range = request.start_date and request.end_date
 
@@ -140,95 +643,34 @@ def _fetch_orders_sync(request: OrdersRequest):
         else:
             created_before = get_business_day_start_utc(0)  # Today's start
 
-    # Fetch orders with pagination
-    all_orders = []
-    next_token = None
+    # Sync new and updated orders into the local store, then aggregate the window from it
+    sync_complete = await anyio.to_thread.run_sync(_sync_orders, orders_api, created_after)
 
-    while True:
-        if next_token:
-            response = orders_api.get_orders(NextToken=next_token)
-        else:
-            created_after_str = created_after.strftime("%Y-%m-%dT%H:%M:%SZ")
-            params = {
-                "CreatedAfter": created_after_str,
-                "MaxResultsPerPage": 100,
-            }
-            if created_before:
-                params["CreatedBefore"] = created_before.strftime("%Y-%m-%dT%H:%M:%SZ")
-            response = orders_api.get_orders(**params)
-
-        orders = response.payload.get("Orders", [])
-        all_orders.extend(orders)
-
-        next_token = response.payload.get("NextToken")
-        if not next_token or len(all_orders) >= 500:
-            break
-
-        time.sleep(0.3)
-
-    # Process orders
-    by_product = defaultdict(lambda: {"orders": [], "totalUnits": 0, "totalRevenue": 0})
-    by_date = defaultdict(lambda: {"units": 0, "revenue": 0})
-    shipped, pending, canceled = 0, 0, 0
-
-    for order in all_orders:
-        # Get order items with exponential backoff retry
-        items = []
-        for attempt in range(5):
-            try:
-                items_response = orders_api.get_order_items(order["AmazonOrderId"])
-                items = items_response.payload.get("OrderItems", [])
-                break
-            except Exception as e:
-                backoff = 2 ** attempt  # 1, 2, 4, 8, 16 seconds
-                if attempt < 4:
-                    time.sleep(backoff)
-                else:
-                    logger.warning("Failed to fetch items for %s: %s", order["AmazonOrderId"], e)
-
-        # Convert order date to Argentina business day
-        order_date_utc = datetime.fromisoformat(order["PurchaseDate"].replace("Z", "+00:00"))
-        order_art = order_date_utc - timedelta(hours=3)
-
-        if order_art.hour < 4:
-            order_art -= timedelta(days=1)
-
-        date_key = order_art.strftime("%Y-%m-%d")
-
-        # Process items
-        for item in items:
-            sku = item.get("SellerSKU", "")
-
-            if request.product_sku != "ALL" and sku != request.product_sku:
-                continue
-
-            product_name = PRODUCTS.get(sku, sku)
-            qty = item.get("QuantityOrdered", 1)
-            price = float(item.get("ItemPrice", {}).get("Amount", 0))
-
-            by_product[product_name]["orders"].append({
-                "orderId": order["AmazonOrderId"],
-                "status": order["OrderStatus"],
-                "quantity": qty,
-                "price": price,
-                "date": date_key,
-            })
-            by_product[product_name]["totalUnits"] += qty
-            by_product[product_name]["totalRevenue"] += price * qty
-
-            by_date[date_key]["units"] += qty
-            by_date[date_key]["revenue"] += price * qty
-
-        # Count statuses
-        status = order["OrderStatus"]
-        if status == "Shipped":
-            shipped += 1
-        elif status == "Pending":
-            pending += 1
-        elif status == "Canceled":
-            canceled += 1
-
-        time.sleep(0.5)  # Respect SP-API getOrderItems rate limit
+    # Order-level totals are enough when no SKU breakdown is wanted
+    if request.product_sku == "ALL" and not request.include_items:
+        total_orders, by_product, by_date, summary = await anyio.to_thread.run_sync(
+            _aggregate_order_totals, created_after, created_before
+        )
+    else:
+        missing = await anyio.to_thread.run_sync(
+            _orders_missing_items, created_after, created_before
+        )
+
+        # Fetch missing order items concurrently; the shared limiter keeps all requests
+        # together near the getOrderItems rate limit. Orders past the budget wait for the
+        # next request, and the response is marked incomplete meanwhile
+        deadline = time.monotonic() + ITEMS_TIME_BUDGET
+        hydrated = await asyncio.gather(*(
+            anyio.to_thread.run_sync(
+                _hydrate_order_items, orders_api, order, deadline, limiter=_items_limiter
+            )
+            for order in missing
+        ))
+        sync_complete = sync_complete and all(hydrated)
+
+        total_orders, by_product, by_date, summary = await anyio.to_thread.run_sync(
+            _aggregate_orders, created_after, created_before, request.product_sku
+        )
 
     # Date range
     if is_custom_range:
@@ -246,22 +688,42 @@ def _fetch_orders_sync(request: OrdersRequest):
         "daysBack": request.days_back,
         "isCustomRange": is_custom_range,
         "productFilter": request.product_sku,
-        "totalOrders": len(all_orders),
-        "byProduct": {k: v for k, v in by_product.items()},
-        "byDate": {k: v for k, v in by_date.items()},
-        "summary": {"shipped": shipped, "pending": pending, "canceled": canceled},
+        "totalOrders": total_orders,
+        "byProduct": by_product,
+        "byDate": by_date,
+        "summary": summary,
+        "syncComplete": sync_complete,
     }
 
 
 @app.post("/api/orders")
 async def get_orders(request: OrdersRequest):
-    try:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _fetch_orders_sync, request)
-    except Exception as e:
-        logger.exception("Error fetching orders")
-        return {"success": False, "error": str(e)}
-
-
-# Mount static files
+    key = (
+        request.days_back, request.product_sku, request.start_date, request.end_date, request.include_items
+    )
+    body = _response_cache.get(key)
+
+    if body is None:
+        if _fetch_limiter.available_tokens == 0:
+            return ORJSONResponse(
+                {"success": False, "error": "Too many requests in progress, try again shortly"},
+                status_code=429,
+            )
+        try:
+            async with _fetch_limiter:
+                result = await _fetch_orders(request)
+        except Exception as e:
+            logger.exception("Error fetching orders")
+            return {"success": False, "error": str(e)}
+
+        body = orjson.dumps(result)
+        # Partial results would hide the rest of the sync from polls for the whole TTL
+        if result["syncComplete"]:
+            _response_cache[key] = body
+
+    return Response(content=body, media_type="application/json")
+
+
+# Mount static files; the root mount serves index.html for "/" and must stay after the API routes
 app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/", StaticFiles(directory="static", html=True), name="root")
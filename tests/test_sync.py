@@ -0,0 +1,284 @@
+"""Local order store: synced results must match aggregating fresh SP-API data directly.
+
+Run from the repo root with `python -m pytest`.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sp_api.base import SellingApiRequestThrottledException
+
+import main
+
+
+class StubOrders:
+    """In-memory stand-in for sp_api's Orders client, paging two orders at a time"""
+
+    PAGE_SIZE = 2
+
+    def __init__(self, orders: list, items: dict):
+        self.orders = {order["AmazonOrderId"]: order for order in orders}
+        self.items = items
+        self.throttled = set()
+        self.pages = {}
+        self.order_queries = []
+        self.item_calls = []
+
+    def get_orders(self, NextToken=None, MaxResultsPerPage=100, **filters):
+        self.order_queries.append(NextToken or filters)
+        if NextToken:
+            matches = self.pages.pop(NextToken)
+        else:
+            matches = sorted(
+                (o for o in self.orders.values() if self._matches(o, filters)),
+                key=lambda o: o["PurchaseDate"],
+            )
+        page, rest = matches[:self.PAGE_SIZE], matches[self.PAGE_SIZE:]
+        payload = {"Orders": page}
+        if rest:
+            token = f"token-{len(self.order_queries)}"
+            self.pages[token] = rest
+            payload["NextToken"] = token
+        return SimpleNamespace(payload=payload, rate_limit=None)
+
+    def get_order_items(self, order_id):
+        self.item_calls.append(order_id)
+        if order_id in self.throttled:
+            raise SellingApiRequestThrottledException([{"code": "QuotaExceeded", "message": "throttled"}])
+        return SimpleNamespace(payload={"OrderItems": self.items[order_id]}, rate_limit=None)
+
+    @staticmethod
+    def _matches(order, filters):
+        if "CreatedAfter" in filters and order["PurchaseDate"] < filters["CreatedAfter"]:
+            return False
+        if "CreatedBefore" in filters and order["PurchaseDate"] >= filters["CreatedBefore"]:
+            return False
+        if "LastUpdatedAfter" in filters and order["LastUpdateDate"] < filters["LastUpdatedAfter"]:
+            return False
+        return True
+
+
+def baseline_aggregate(api: StubOrders, created_after, created_before, product_sku="ALL"):
+    """The aggregation /api/orders did before the local store, over the stub's current data"""
+    orders = sorted(
+        (o for o in api.orders.values()
+         if StubOrders._matches(o, {
+             "CreatedAfter": main.to_sp_api_timestamp(created_after),
+             **({"CreatedBefore": main.to_sp_api_timestamp(created_before)} if created_before else {}),
+         })),
+        key=lambda o: o["PurchaseDate"],
+    )
+    by_product = defaultdict(lambda: {"orders": [], "totalUnits": 0, "totalRevenue": 0})
+    by_date = defaultdict(lambda: {"units": 0, "revenue": 0})
+    shipped, pending, canceled = 0, 0, 0
+
+    for order in orders:
+        order_date_utc = datetime.fromisoformat(order["PurchaseDate"].replace("Z", "+00:00"))
+        order_art = order_date_utc - timedelta(hours=3)
+        if order_art.hour < 4:
+            order_art -= timedelta(days=1)
+        date_key = order_art.strftime("%Y-%m-%d")
+
+        for item in api.items[order["AmazonOrderId"]]:
+            sku = item.get("SellerSKU", "")
+            if product_sku != "ALL" and sku != product_sku:
+                continue
+            product_name = main.PRODUCTS.get(sku, sku)
+            qty = item.get("QuantityOrdered", 1)
+            price = float(item.get("ItemPrice", {}).get("Amount", 0))
+            by_product[product_name]["orders"].append({
+                "orderId": order["AmazonOrderId"],
+                "status": order["OrderStatus"],
+                "quantity": qty,
+                "price": price,
+                "date": date_key,
+            })
+            by_product[product_name]["totalUnits"] += qty
+            by_product[product_name]["totalRevenue"] += price * qty
+            by_date[date_key]["units"] += qty
+            by_date[date_key]["revenue"] += price * qty
+
+        status = order["OrderStatus"]
+        if status == "Shipped":
+            shipped += 1
+        elif status == "Pending":
+            pending += 1
+        elif status == "Canceled":
+            canceled += 1
+
+    return {
+        "totalOrders": len(orders),
+        "byProduct": dict(by_product),
+        "byDate": dict(by_date),
+        "summary": {"shipped": shipped, "pending": pending, "canceled": canceled},
+    }
+
+
+def make_order(order_id, purchase_date, status="Shipped", last_updated=None):
+    return {
+        "AmazonOrderId": order_id,
+        "PurchaseDate": main.to_sp_api_timestamp(purchase_date),
+        "LastUpdateDate": main.to_sp_api_timestamp(last_updated or purchase_date),
+        "OrderStatus": status,
+        "NumberOfItemsShipped": 1,
+        "OrderTotal": {"Amount": "10.00", "CurrencyCode": "USD"},
+    }
+
+
+def make_item(sku, qty, price):
+    return {"SellerSKU": sku, "QuantityOrdered": qty, "ItemPrice": {"Amount": price}}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setitem(main.CONFIG, "ORDERS_DB_PATH", str(tmp_path / "orders.db"))
+    monkeypatch.setattr(main, "_db", None)
+    monkeypatch.setattr(main, "SYNC_INTERVAL", timedelta(0))
+    monkeypatch.setattr(main, "_orders_rate_limiter", main.RateLimiter(rate=1000, burst=1000))
+    monkeypatch.setattr(main, "_order_items_rate_limiter", main.RateLimiter(rate=1000, burst=1000))
+    yield
+    if main._db is not None:
+        main._db.close()
+
+
+@pytest.fixture
+def window():
+    """Last three business days, before today"""
+    return main.get_business_day_start_utc(3), main.get_business_day_start_utc(0)
+
+
+@pytest.fixture
+def api(monkeypatch, window):
+    created_after, _ = window
+    orders = [
+        make_order("A1", created_after + timedelta(hours=1)),
+        make_order("A2", created_after + timedelta(hours=5), status="Pending"),
+        make_order("A3", created_after + timedelta(hours=26), status="Canceled"),
+        make_order("A4", created_after + timedelta(hours=30)),
+        make_order("A5", created_after + timedelta(hours=50)),
+        make_order("OLD", created_after - timedelta(hours=2)),
+    ]
+    items = {
+        "A1": [make_item("VM-7EA4-DVAO", 2, "24.50")],
+        "A2": [make_item("5Y-T9K7-1HM1", 1, "39.00"), make_item("VM-7EA4-DVAO", 1, "24.50")],
+        "A3": [make_item("J9-H173-J5AF", 1, "12.25")],
+        "A4": [make_item("J9-H173-J5AF", 3, "12.25")],
+        "A5": [make_item("5Y-T9K7-1HM1", 2, "39.00")],
+        "OLD": [make_item("5Y-T9K7-1HM1", 5, "39.00")],
+    }
+    stub = StubOrders(orders, items)
+    monkeypatch.setattr(main, "get_orders_client", lambda: stub)
+    return stub
+
+
+def fetch(product_sku="ALL", days_back=3):
+    return asyncio.run(main._fetch_orders(main.OrdersRequest(days_back=days_back, product_sku=product_sku)))
+
+
+def assert_matches_baseline(result, api, window, product_sku="ALL"):
+    expected = baseline_aggregate(api, *window, product_sku)
+    assert {key: result[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize("product_sku", ["ALL", "VM-7EA4-DVAO", "J9-H173-J5AF"])
+def test_backfill_matches_baseline(store, api, window, product_sku):
+    result = fetch(product_sku)
+
+    assert result["syncComplete"] is True
+    assert_matches_baseline(result, api, window, product_sku)
+    assert "OLD" not in api.item_calls
+
+
+def test_repeat_fetch_keeps_stored_items(store, api, window):
+    fetch()
+    api.item_calls.clear()
+
+    result = fetch()
+
+    assert api.item_calls == []
+    assert_matches_baseline(result, api, window)
+
+
+def test_delta_status_change_refetches_items(store, api, window):
+    now = datetime.now(timezone.utc)
+    # Recently updated, so every delta returns A4 again, unchanged; its items are kept
+    api.orders["A4"]["LastUpdateDate"] = main.to_sp_api_timestamp(now - timedelta(minutes=1))
+    fetch()
+    api.item_calls.clear()
+
+    # A2 ships with one line dropped; its stored items must not survive the update
+    api.orders["A2"].update(OrderStatus="Shipped", LastUpdateDate=main.to_sp_api_timestamp(now))
+    api.items["A2"] = [make_item("5Y-T9K7-1HM1", 1, "39.00")]
+
+    result = fetch()
+
+    assert api.item_calls == ["A2"]
+    assert result["summary"]["pending"] == 0
+    assert_matches_baseline(result, api, window)
+
+
+def test_changed_order_drops_stored_items(store, api, window):
+    fetch()
+    db = main.get_db()
+
+    changed = dict(api.orders["A1"], LastUpdateDate=main.to_sp_api_timestamp(datetime.now(timezone.utc)))
+    main._upsert_orders([changed, api.orders["A3"]])
+
+    rows = dict(db.execute(
+        "SELECT o.amazon_order_id, COUNT(i.rowid) FROM orders o "
+        "LEFT JOIN order_items i USING (amazon_order_id) WHERE o.items_json IS NULL GROUP BY 1"
+    ).fetchall())
+    assert rows == {"A1": 0}
+    assert db.execute("SELECT COUNT(*) FROM order_items WHERE amazon_order_id = 'A3'").fetchone() == (1,)
+
+
+def test_stale_items_are_not_saved(store, api, window):
+    fetch()
+    before = main.to_sp_api_timestamp(datetime.now(timezone.utc) - timedelta(hours=1))
+    changed = dict(api.orders["A1"], LastUpdateDate=main.to_sp_api_timestamp(datetime.now(timezone.utc)))
+    main._upsert_orders([changed])
+
+    # Items fetched for the order as it was before the update
+    assert main._hydrate_order_items(api, {"AmazonOrderId": "A1", "LastUpdateDate": before}) is True
+
+    missing = main._orders_missing_items(*window)
+    assert [order["AmazonOrderId"] for order in missing] == ["A1"]
+    db = main.get_db()
+    assert db.execute("SELECT COUNT(*) FROM order_items WHERE amazon_order_id = 'A1'").fetchone() == (0,)
+
+
+def test_sync_resumes_after_time_budget(store, api, window, monkeypatch):
+    # Two getOrders pages per request: the backfill's third page waits for the next one
+    monkeypatch.setattr(main, "SYNC_TIME_BUDGET", 0.5)
+    monkeypatch.setattr(main, "_orders_rate_limiter", main.RateLimiter(rate=1, burst=2))
+
+    first = fetch()
+
+    assert first["syncComplete"] is False
+    assert first["totalOrders"] == 4
+    assert len(api.order_queries) == 2
+
+    monkeypatch.setattr(main, "_orders_rate_limiter", main.RateLimiter(rate=1, burst=2))
+    second = fetch()
+
+    assert api.order_queries[2] == "token-2"
+    assert second["syncComplete"] is True
+    assert_matches_baseline(second, api, window)
+
+
+def test_throttled_items_give_up_and_retry_later(store, api, window, monkeypatch):
+    api.throttled.add("A4")
+
+    result = fetch()
+
+    assert api.item_calls.count("A4") == main.MAX_THROTTLED_RETRIES + 1
+    assert result["byDate"] != baseline_aggregate(api, *window)["byDate"]
+
+    api.throttled.clear()
+    api.item_calls.clear()
+    result = fetch()
+
+    assert api.item_calls == ["A4"]
+    assert_matches_baseline(result, api, window)